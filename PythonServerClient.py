@@ -1,5 +1,9 @@
 from multiprocessing.managers import BaseManager
+import atexit
+from multiprocessing import shared_memory, resource_tracker
+import os
 import time
+from manager_server import FLAGS_NAME, FLAG_SLOTS, FLAG_UNSET
 
 
 class SharedDataManager(BaseManager):
@@ -21,6 +25,16 @@ class PythonServer:
             print(f"Unexpected error: {e}")
             self.shared_data = None
 
+        # Attach to the flag block created by manager_server
+        try:
+            self._shm = shared_memory.SharedMemory(name=FLAGS_NAME)
+            if os.name == 'posix':
+                # Only the server owns the block; keep this process from unlinking it on exit
+                resource_tracker.unregister(self._shm._name, 'shared_memory')
+        except FileNotFoundError:
+            print("Error: Could not attach to the shared flags")
+            self._shm = None
+
     def read_data(self, key):
         if self.shared_data is None:
             return None
@@ -46,43 +60,129 @@ class PythonServer:
             print(f"Error writing data: {e}")
             return None
 
+    def read_flag(self, key):
+        """Read a numeric flag from shared memory without a server round-trip"""
+        if self._shm is None:
+            return None
+        value = self._shm.buf[FLAG_SLOTS[key]]
+        return None if value == FLAG_UNSET else value
+
+    def write_flag(self, key, value):
+        """Write a numeric flag (None, bool or 0-254) to shared memory"""
+        if self._shm is None:
+            return None
+        self._set_flag(key, value)
+        if key == 'recording_command':
+            self.notify_command()
+
+    def _set_flag(self, key, value):
+        self._shm.buf[FLAG_SLOTS[key]] = FLAG_UNSET if value is None else int(value)
+
+    def read_many(self, keys):
+        """Read several keys at once: flags from shared memory, the rest in one server call"""
+        result = {key: self.read_flag(key) for key in keys if key in FLAG_SLOTS}
+        others = [key for key in keys if key not in FLAG_SLOTS]
+        if others:
+            result.update(dict.fromkeys(others))
+            if self.shared_data is not None:
+                try:
+                    result.update(self.shared_data.batch_read(others))
+                except Exception as e:
+                    print(f"Error reading data: {e}")
+        return result
+
+    def write_many(self, mapping):
+        """Write several keys at once: flags to shared memory, the rest in one server call"""
+        data = {}
+        for key, value in mapping.items():
+            if key not in FLAG_SLOTS:
+                data[key] = value
+            elif self._shm is not None:
+                self._set_flag(key, value)
+
+        if self.shared_data is None:
+            return None
+        try:
+            if self.shared_data.batch_update(data, 'recording_command' in mapping):
+                print('Data written to python server successfully')
+            else:
+                print('Writing to python server was unsuccessful')
+        except Exception as e:
+            print(f"Error writing data: {e}")
+            return None
+
+    def notify_command(self):
+        """Wake clients waiting for a new recording command"""
+        if self.shared_data is None:
+            return None
+        try:
+            self.shared_data.notify_command()
+        except Exception as e:
+            print(f"Error notifying command: {e}")
+
+    def wait_for_change(self, last_version, timeout=30):
+        """Block server-side until a new recording command is written; return its version"""
+        if self.shared_data is None:
+            return None
+        try:
+            return self.shared_data.wait_for_change(last_version, timeout)
+        except Exception as e:
+            print(f"Error waiting for command: {e}")
+            return None
 
     def close(self):
         """Properly clean up the connection"""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm = None
         if self.manager:
             # For BaseManager, we just need to clear references
             self.shared_data = None
             self.manager = None
 
 
-def start_daq_recording(storePath=''):
-    CC = PythonServer()
-    CC.write_data('storePath', storePath)
-    read_data = CC.read_data('storePath')
-    print('StorePath send to DAQ recorder: ', read_data)
+_SINGLETON = None
+
+
+def get_server():
+    """Return a shared PythonServer connection, reconnecting if the last attempt failed"""
+    global _SINGLETON
+    if _SINGLETON is None or _SINGLETON.shared_data is None:
+        if _SINGLETON is not None:
+            _SINGLETON.close()
+        _SINGLETON = PythonServer()
+    return _SINGLETON
+
+
+@atexit.register
+def _close_server():
+    if _SINGLETON is not None:
+        _SINGLETON.close()
 
-    CC.write_data('recording_command', False)
+
+def start_daq_recording(storePath=''):
+    CC = get_server()
+    CC.write_many({'storePath': storePath, 'recording_command': False})
     time.sleep(1)
-    CC.write_data('recording_command', True)
-    read_data = CC.read_data('recording_command')
-    print('Recording command: ', read_data)
+    CC.write_flag('recording_command', True)
+    read_data = CC.read_many(['storePath', 'recording_command'])
+    print('StorePath send to DAQ recorder: ', read_data['storePath'])
+    print('Recording command: ', read_data['recording_command'])
     time.sleep(1)
 
-    read_data = CC.read_data('recording')
+    read_data = CC.read_flag('recording')
     print('Recording state: ', read_data)
-    CC.close()
 
 
 def stop_daq_recording():
-    CC = PythonServer()
-    CC.write_data('recording_command', False)
-    read_data = CC.read_data('recording_command')
+    CC = get_server()
+    CC.write_flag('recording_command', False)
+    read_data = CC.read_flag('recording_command')
     print('Recording command: ', read_data)
     time.sleep(5)
     CC.write_data('storePath', None)
-    read_data = CC.read_data('recording')
+    read_data = CC.read_flag('recording')
     print('Recording state: ', read_data)
-    CC.close()
 
 
 if __name__ == '__main__':
@@ -95,17 +195,17 @@ if __name__ == '__main__':
     while True:
         cmd = input('Enter command (s, e, q): ')
         if cmd == 's':
-            CC.write_data('recording_command', True)
+            CC.write_flag('recording_command', True)
         elif cmd == 'e':
-            CC.write_data('recording_command', False)
+            CC.write_flag('recording_command', False)
         elif cmd == 'q':
             break
         else:
             continue
-        read_data = CC.read_data('recording')
+        read_data = CC.read_flag('recording')
         print('Recoding state: ', read_data)
 
-        read_data = CC.read_data('recording_command')
+        read_data = CC.read_flag('recording_command')
         print('Recoding command: ', read_data)
 
     CC.close()
\ No newline at end of file
@@ -5,15 +5,73 @@ from PyQt6.QtWidgets import (QApplication, QMainWindow, QVBoxLayout,
                              QCheckBox, QScrollArea)
 from PyQt6.QtCore import Qt, pyqtSignal, QObject
 import pyqtgraph as pg
+from numba import njit
 import nidaqmx
+from nidaqmx.stream_readers import AnalogUnscaledReader
 from threading import Thread, Event
 import h5py
 from datetime import datetime
 import time
 import json
+from collections import deque
 import threading
 from PythonServerClient import PythonServer
 
+pg.setConfigOptions(useOpenGL=True, enableExperimental=True)
+
+# One row per run of contiguous samples: time.monotonic_ns() of its first sample and its length.
+# Rows follow the data in order; per-sample times are t0_ns + np.arange(n) * 1e9 / sample_rate.
+# The file attributes start_monotonic_ns/start_time_ns map monotonic time back to wall-clock time.
+TIMESTAMP_DTYPE = np.dtype([('t0_ns', '<i8'), ('n', '<u4')])
+
+# Samples are kept as raw 16-bit ADC codes; volts = polyval(code, scaling_coeff).
+# Until a task reports its device coefficients, assume a linear +/-10 V range.
+DEFAULT_SCALING_COEFF = np.array([0.0, 20.0 / 65536])
+
+
+@njit(cache=True, fastmath=True, nogil=True)
+def minmax_decimate(ring, start, out_len):
+    """Reduce a circular buffer (oldest sample at start) to out_len (min, max) pairs in time order."""
+    n = ring.shape[0]
+    out = np.empty(2 * out_len, dtype=ring.dtype)
+    for b in range(out_len):
+        lo = b * n // out_len
+        hi = (b + 1) * n // out_len
+        idx = start + lo
+        if idx >= n:
+            idx -= n
+        mn = ring[idx]
+        mx = ring[idx]
+        for j in range(lo + 1, hi):
+            idx += 1
+            if idx == n:
+                idx = 0
+            v = ring[idx]
+            if v < mn:
+                mn = v
+            if v > mx:
+                mx = v
+        out[2 * b] = mn
+        out[2 * b + 1] = mx
+    return out
+
+
+@njit('i8(i2[:, ::1], i8, i2[:, ::1])', cache=True, nogil=True, boundscheck=False)
+def ring_write(ring, start, new):
+    """Copy a (channels, samples) chunk into a circular (channels, buffer) array at start; return the next index."""
+    n = ring.shape[1]
+    m = new.shape[1]
+    first = max(0, m - n)
+    for c in range(ring.shape[0]):
+        idx = start
+        for j in range(first, m):
+            ring[c, idx] = new[c, j]
+            idx += 1
+            if idx == n:
+                idx = 0
+    return (start + m - first) % n
+
+
 class DAQController(QObject):
     toggle_logging_signal = pyqtSignal(bool)
 
@@ -26,10 +84,10 @@ class MultiChannelDAQ_GUI(QMainWindow):
 
         # DAQ Configuration
         self.sample_rate = 10000  # 10 kHz
-        self.update_interval = 100  # Plot update interval (ms)
         self.plot_window = 60.0  # Seconds of data to display
         self.buffer_size = int(self.sample_rate * self.plot_window)
         self.read_chunk_size = int(self.sample_rate * 0.1)  # Read 100ms at a time
+        self.flush_size = 65536  # Samples per HDF5 append (128 KB of int16 per channel)
 
         # Available channels
         self.all_channels = {
@@ -41,17 +99,29 @@ class MultiChannelDAQ_GUI(QMainWindow):
 
         # Start with first two channels enabled by default
         self.active_channels = ["Dev1/ai0", "Dev1/ai5"]
-        self.data_buffers = {ch: np.zeros(self.buffer_size) for ch in self.active_channels}
-        # In your initialization code (__init__ or setup method)
-        self.dtype = np.float64  # Centralize your data type definition
-        # self.data_buffers = {
-        #     ch: np.zeros(self.buffer_size, dtype=self.dtype)
-        #     for ch in self.active_channels
-        # }
+        self.dtype = np.int16  # Raw ADC codes; see DEFAULT_SCALING_COEFF
+        self.scaling_coeff = {}  # Per-channel polynomial from raw code to volts
+        # Circular plot buffers, one row per active channel; write_idx points at the oldest sample
+        self.data_buffers = np.zeros((len(self.active_channels), self.buffer_size), dtype=self.dtype)
+        self.ch_idx = {ch: i for i, ch in enumerate(self.active_channels)}
+        self.write_idx = 0
         self.stop_event = Event()
+        self.dirty = Event()  # Set by the DAQ thread when new samples are in the plot buffers
         self.is_logging = False
         self.h5_file = None
+        # Single-producer/single-consumer hand-off to the HDF5 writer; deque append/popleft are atomic
+        self._hdf5_chunks = deque()
+        self._hdf5_max_chunks = 16
+        self._hdf5_ready = Event()  # Wakes the writer after an append
+        self._hdf5_writer_thread = None
+        self._flush_stop = Event()
+        self._flush_thread = None
+        self.flush_bufs = {}  # Per-channel staging buffers for HDF5 appends
+        self.flush_fill = {}  # Number of samples currently staged per channel
+        self.flush_segs = {}  # Per-channel [t0_ns, n] runs of contiguous staged samples
         self.tab_orange_rgb = (255, 127, 14)  # Matplotlib's tab:orange in 0-255 range
+        self._pen = pg.mkPen(color=self.tab_orange_rgb)  # Shared by all curves
+        self.time_axis = None  # Shared x values for the decimated plot data, rebuilt on resize
 
         # GUI Setup
         self.init_ui()
@@ -62,7 +132,7 @@ class MultiChannelDAQ_GUI(QMainWindow):
 
         # Setup multiprocessing recording flag
         self.server = PythonServer()
-        self.server.write_data('recording', 0)
+        self.server.write_flag('recording', 0)
         self.start_logging_monitor()
 
     def init_ui(self):
@@ -75,14 +145,14 @@ class MultiChannelDAQ_GUI(QMainWindow):
         channel_layout = QHBoxLayout()
 
         # Checkboxes for each channel
-        self.channel_checkboxes = []
+        self._cb_to_ch = {}
         for ch_id, ch_name in self.all_channels.items():
             cb = QCheckBox(ch_name)
             # Set first two channels checked by default
             if ch_id in self.active_channels:
                 cb.setChecked(True)
             cb.stateChanged.connect(self.update_active_channels)
-            self.channel_checkboxes.append(cb)
+            self._cb_to_ch[cb] = ch_id
             channel_layout.addWidget(cb)
 
         channel_select.setLayout(channel_layout)
@@ -108,16 +178,24 @@ class MultiChannelDAQ_GUI(QMainWindow):
         self.setCentralWidget(main_widget)
 
         # Create initial plots for default channels
-        self.rebuild_plots()
+        self.plot_curves = {}
+        self.plot_items = {}
+        self.show_active_plots()
 
     def start_logging_monitor(self):
-        """Start a thread to monitor and toggle logging periodically."""
+        """Start a thread that toggles logging when a new recording command is written."""
         self._monitor_running = True
 
         def monitor_loop():
+            version = None  # Forces an initial check of any pending command
             while self._monitor_running:
+                new_version = self.server.wait_for_change(version, timeout=30)
+                if not self._monitor_running:
+                    break  # Woken up by stop_logging_monitor
+                if new_version is None:
+                    time.sleep(1)  # No manager connection; fall back to polling the flag
+                version = new_version
                 self.external_toggle_logging()
-                time.sleep(1)
 
         self._monitor_thread = threading.Thread(target=monitor_loop, daemon=True)
         self._monitor_thread.start()
@@ -125,72 +203,83 @@ class MultiChannelDAQ_GUI(QMainWindow):
     def stop_logging_monitor(self):
         """Stop the logging monitor thread."""
         self._monitor_running = False
+        self.server.notify_command()  # Wake the thread blocked in wait_for_change
         if hasattr(self, '_monitor_thread'):
             self._monitor_thread.join(timeout=2)  # Wait up to 2 seconds for thread to finish
 
     def external_toggle_logging(self):
-        recording_command = self.server.read_data('recording_command')
+        recording_command = self.server.read_flag('recording_command')
         print('Recording ON', recording_command, self.is_logging)
         if recording_command is not None:
             if recording_command and not self.is_logging:
                 self.toggle_logging()
-                self.server.write_data('recording_command', None)
+                self.server.write_flag('recording_command', None)
             elif not recording_command and self.is_logging:
                 self.toggle_logging()
-                self.server.write_data('recording_command', None)
+                self.server.write_flag('recording_command', None)
 
     def update_active_channels(self):
         """Update which channels are active based on checkboxes."""
-        self.active_channels = [
-            ch_id for ch_id, ch_name in self.all_channels.items()
-            if any(cb.isChecked() and cb.text() == ch_name
-                   for cb in self.channel_checkboxes)
-        ]
+        active_channels = [ch for cb, ch in self._cb_to_ch.items() if cb.isChecked()]
+        if active_channels == self.active_channels:
+            return
+        self.active_channels = active_channels
+
+        # Stop the running acquisition before touching its buffers
+        if self.daq_thread and self.daq_thread.is_alive():
+            self.stop_event.set()
+            self.daq_thread.join()
 
-        # Reset data buffers
-        self.data_buffers = {ch: np.zeros(self.buffer_size)
-                             for ch in self.active_channels}
+        # Keep the history of channels that stay enabled; added channels start at zero
+        data_buffers = np.zeros((len(self.active_channels), self.buffer_size), dtype=self.dtype)
+        for i, ch in enumerate(self.active_channels):
+            if ch in self.ch_idx:
+                data_buffers[i] = self.data_buffers[self.ch_idx[ch]]
+        self.data_buffers = data_buffers
+        self.ch_idx = {ch: i for i, ch in enumerate(self.active_channels)}
 
-        # Rebuild plots
-        self.rebuild_plots()
+        # Show/hide plots for the changed channels
+        self.show_active_plots()
 
-        # Start/restart DAQ thread if needed
+        # Restart DAQ thread if needed
         if self.active_channels:
             self.btn_log.setEnabled(True)
-            if self.daq_thread and self.daq_thread.is_alive():
-                self.stop_event.set()
-                self.daq_thread.join()
             self.stop_event = Event()
             self.daq_thread = Thread(target=self.daq_worker, daemon=True)
             self.daq_thread.start()
         else:
             self.btn_log.setEnabled(False)
 
-    def rebuild_plots(self):
-        """Create/update plot widgets for active channels."""
-        # Clear existing plots
-        for i in reversed(range(self.plot_layout.count())):
-            self.plot_layout.itemAt(i).widget().setParent(None)
-
-        # Create new plots
-        self.plot_curves = {}
-        for ch in self.active_channels:
-            plot = pg.PlotWidget(title=self.all_channels[ch])
-            plot.setLabel('left', 'Voltage (V)')
-            plot.setLabel('bottom', 'Time (s)')
-            plot.setYRange(-10, 10)
-            curve = plot.plot(pen=pg.mkPen(color=self.tab_orange_rgb))
-            self.plot_curves[ch] = curve
-            self.plot_layout.addWidget(plot)
+    def show_active_plots(self):
+        """Show plot widgets of active channels and hide the rest; each widget is created once."""
+        pos = 0  # Layout index, so plots stay in channel order
+        for ch in self.all_channels:
+            if ch not in self.plot_items:
+                if ch not in self.active_channels:
+                    continue
+                plot = pg.PlotWidget(title=self.all_channels[ch])
+                plot.setLabel('left', 'Voltage (V)')
+                plot.setLabel('bottom', 'Time (s)')
+                plot.setYRange(-10, 10)
+                curve = plot.plot(pen=self._pen)
+                curve.setDownsampling(auto=True, method='peak')
+                curve.setClipToView(True)
+                self.plot_curves[ch] = curve
+                self.plot_items[ch] = plot
+                self.plot_layout.insertWidget(pos, plot)
+            self.plot_items[ch].setVisible(ch in self.active_channels)
+            pos += 1
+        self.dirty.set()
 
     def daq_worker(self):
-        """Thread to read DAQ data and update plots and logging with robust HDF5 handling."""
+        """Thread that owns the DAQ task; chunks are handled in on_samples_acquired."""
         if not self.active_channels:
             return
 
         task = nidaqmx.Task()
         for ch in self.active_channels:
-            task.ai_channels.add_ai_voltage_chan(ch)
+            chan = task.ai_channels.add_ai_voltage_chan(ch)
+            self.scaling_coeff[ch] = np.array(chan.ai_dev_scaling_coeff)
 
         # Configure timing with buffer
         task.timing.cfg_samp_clk_timing(
@@ -198,195 +287,142 @@ class MultiChannelDAQ_GUI(QMainWindow):
             sample_mode=nidaqmx.constants.AcquisitionType.CONTINUOUS,
             samps_per_chan=self.sample_rate * 5
         )
+
+        # Read raw int16 codes straight into a preallocated (channels, samples) array
+        self._reader = AnalogUnscaledReader(task.in_stream)
+        self._read_buf = np.empty((len(self.active_channels), self.read_chunk_size), dtype=np.int16)
+        self._read_channels = self.active_channels
+        # Set when samples were lost, so logging starts a new timestamp block; a restart
+        # while logging loses the samples between the old and new task
+        self._log_gap = self.is_logging
+
+        # Let DAQmx call us as soon as each chunk is in the buffer instead of polling
+        task.register_every_n_samples_acquired_into_buffer_event(
+            self.read_chunk_size, self.on_samples_acquired)
         task.start()
 
         try:
-            while not self.stop_event.is_set():
-                try:
-                    # Read data chunk
-                    new_data = task.read(
-                        number_of_samples_per_channel=self.read_chunk_size,
-                        timeout=2.0
-                    )
-
-                    # Ensure data is in list of arrays format
-                    if len(self.active_channels) == 1:
-                        new_data = [new_data]
-
-                    # Convert all channels to numpy arrays with explicit float32 dtype
-                    new_data = [np.asarray(ch_data, dtype=np.float32) for ch_data in new_data]
-
-                    # Update in-memory buffers
-                    for i, ch in enumerate(self.active_channels):
-                        self.data_buffers[ch] = np.roll(self.data_buffers[ch], -len(new_data[i]))
-                        self.data_buffers[ch][-len(new_data[i]):] = new_data[i]
-
-                    # Log to HDF5 if enabled
-                    if self.is_logging and self.h5_file:
-                        timestamp = datetime.now().isoformat()
-                        for i, ch in enumerate(self.active_channels):
-                            channel_name = self.all_channels[ch]
-                            data_path = f"data/{channel_name}"
-                            time_path = f"timestamps/{channel_name}"
-
-                            try:
-                                # Skip if no data
-                                if len(new_data[i]) <= 0:
-                                    continue
-
-                                # Initialize flag for dataset recreation
-                                recreate_datasets = False
-
-                                # Check existing datasets
-                                if data_path in self.h5_file:
-                                    try:
-                                        # Test if dataset is accessible
-                                        test = self.h5_file[data_path].dtype
-                                    except:
-                                        recreate_datasets = True
-                                else:
-                                    recreate_datasets = True
-
-                                if recreate_datasets:
-                                    # Safely remove existing datasets if they exist
-                                    for path in [data_path, time_path]:
-                                        if path in self.h5_file:
-                                            try:
-                                                del self.h5_file[path]
-                                            except:
-                                                pass
-
-                                    # Create new datasets with explicit simple types
-                                    self.h5_file.create_dataset(
-                                        data_path,
-                                        data=new_data[i],
-                                        maxshape=(None,),
-                                        dtype='float32',  # Simple type specification
-                                        chunks=(min(1000, len(new_data[i])),),
-                                        compression="gzip"
-                                    )
-                                    self.h5_file.create_dataset(
-                                        time_path,
-                                        data=np.array([timestamp] * len(new_data[i]), dtype=h5py.string_dtype()),
-                                        maxshape=(None,),
-                                        chunks=(min(1000, len(new_data[i])),),
-                                        compression="gzip"
-                                    )
-                                else:
-                                    # Access existing datasets
-                                    data_dset = self.h5_file[data_path]
-                                    time_dset = self.h5_file[time_path]
-
-                                    # Resize datasets
-                                    new_length = data_dset.shape[0] + len(new_data[i])
-                                    data_dset.resize(new_length, axis=0)
-                                    time_dset.resize(new_length, axis=0)
-
-                                    # Write data with explicit type conversion
-                                    write_data = np.array(new_data[i], dtype=data_dset.dtype)
-                                    data_dset[-len(write_data):] = write_data
-                                    time_dset[-len(write_data):] = np.array([timestamp] * len(write_data),
-                                                                            dtype=h5py.string_dtype())
-
-                            except Exception as e:
-                                print(f"Error processing channel {ch}: {str(e)}")
-                                continue
-
-                except nidaqmx.DaqError as e:
-                    if e.error_code == -200284:
-                        continue  # Buffer overflow
-                    elif e.error_code == -200279:
-                        continue  # Read position error
-                    print(f"DAQ Error: {str(e)}")
-                    continue
-
-                except Exception as e:
-                    print(f"Unexpected error: {str(e)}")
-                    continue
-
-                time.sleep(self.update_interval / 1000)
-
+            self.stop_event.wait()
         finally:
             try:
                 task.stop()
                 task.close()
             except:
                 pass
-            if self.is_logging and self.h5_file:
-                try:
-                    self.h5_file.flush()
-                except:
-                    pass
             print("DAQ task stopped and closed")
 
-    def daq_worker_old(self):
-        """Thread to read DAQ data and update plots."""
-        if not self.active_channels:
+    def on_samples_acquired(self, task_handle, every_n_samples_event_type, number_of_samples, callback_data):
+        """DAQmx callback: read the chunk that just arrived, update plot buffers and queue it for logging."""
+        try:
+            # The chunk's first sample was acquired one chunk duration ago
+            read_time = time.monotonic_ns() - self.read_chunk_size * 1_000_000_000 // self.sample_rate
+            self._reader.read_int16(
+                self._read_buf,
+                number_of_samples_per_channel=self.read_chunk_size,
+                timeout=2.0
+            )
+            new_data = self._read_buf
+
+            # Update in-memory buffers (all channels in one pass)
+            self.write_idx = ring_write(self.data_buffers, self.write_idx, new_data)
+            self.dirty.set()
+
+            # Hand off to the HDF5 writer thread if logging
+            if self.is_logging:
+                if len(self._hdf5_chunks) < self._hdf5_max_chunks:
+                    self._hdf5_chunks.append((read_time, self._read_channels, new_data.copy(), self._log_gap))
+                    self._hdf5_ready.set()
+                    self._log_gap = False
+                else:
+                    # Drop the newest chunk so the queued ones stay contiguous
+                    print("HDF5 writer falling behind - dropped a chunk")
+                    self._log_gap = True
+
+        except nidaqmx.DaqError as e:
+            # Buffer overflow (-200284) and read position (-200279) errors recover on the next
+            # chunk, but samples were lost in between
+            if e.error_code in (-200284, -200279):
+                self._log_gap = True
+            else:
+                print(f"DAQ Error: {str(e)}")
+
+        except Exception as e:
+            print(f"Unexpected error: {str(e)}")
+
+        return 0
+
+    def _hdf5_consumer(self):
+        """Thread that drains queued DAQ chunks and performs all HDF5 writes."""
+        while True:
+            self._hdf5_ready.wait()
+            self._hdf5_ready.clear()
+            while self._hdf5_chunks:
+                item = self._hdf5_chunks.popleft()
+                if item is None:
+                    return
+
+                read_time, channels, data, gap = item
+                for i, ch in enumerate(channels):
+                    try:
+                        self.append_to_log(ch, data[i], read_time, gap)
+                    except Exception as e:
+                        print(f"Error processing channel {ch}: {str(e)}")
+                        continue
+
+    def _flush_loop(self):
+        """Thread that flushes the HDF5 file periodically to bound data loss on a crash."""
+        while not self._flush_stop.wait(5):
+            try:
+                self.h5_file.flush()
+            except Exception as e:
+                print(f"Error flushing HDF5 file: {str(e)}")
+
+    def append_to_log(self, ch, samples, read_time, gap=False):
+        """Stage samples for a channel and write them to HDF5 once a full block is collected."""
+        buf = self.flush_bufs[ch]
+        segs = self.flush_segs[ch]
+        if gap and segs:
+            segs.append([read_time, 0])  # Samples were lost: new timestamp row, same data block
+        pos = 0
+        while pos < len(samples):
+            fill = self.flush_fill[ch]
+            if not segs:
+                segs.append([read_time + pos * 1_000_000_000 // self.sample_rate, 0])
+
+            n = min(self.flush_size - fill, len(samples) - pos)
+            np.copyto(buf[fill:fill + n], samples[pos:pos + n])
+            self.flush_fill[ch] = fill + n
+            segs[-1][1] += n
+            pos += n
+
+            if self.flush_fill[ch] == self.flush_size:
+                self.flush_channel(ch)
+
+    def flush_channel(self, ch):
+        """Append the staged block of a channel to its HDF5 datasets in one write."""
+        fill = self.flush_fill[ch]
+        if fill == 0:
             return
 
-        task = nidaqmx.Task()
-        for ch in self.active_channels:
-            task.ai_channels.add_ai_voltage_chan(ch)
+        data_dset, time_dset = self.log_dsets[ch]
 
-        # Configure timing with a larger buffer
-        task.timing.cfg_samp_clk_timing(
-            rate=self.sample_rate,
-            sample_mode=nidaqmx.constants.AcquisitionType.CONTINUOUS,
-            samps_per_chan=self.sample_rate * 5  # 2-second buffer in hardware
-        )
-        task.start()
+        # Grow by exactly one block so SWMR readers (and a file left by a crash) never see unwritten samples
+        ptr = self.write_ptr[ch]
+        data_dset.resize(ptr + fill, axis=0)
+        if fill == self.flush_size and ptr % self.flush_size == 0:
+            # Block lines up with one whole chunk: hand the raw buffer straight to the file
+            data_dset.id.write_direct_chunk((ptr,), self.flush_bufs[ch], filter_mask=0)
+        else:
+            data_dset.write_direct(self.flush_bufs[ch], source_sel=np.s_[:fill], dest_sel=np.s_[ptr:ptr + fill])
+        self.write_ptr[ch] = ptr + fill
 
-        try:
-            while not self.stop_event.is_set():
-                try:
-                    # Read smaller chunks more frequently
-                    new_data = task.read(
-                        number_of_samples_per_channel=self.read_chunk_size,
-                        timeout=2.0  # Timeout in seconds
-                    )
-
-                    # Handle single channel case (returns 1D array) vs multi-channel (returns list of arrays)
-                    if len(self.active_channels) == 1:
-                        new_data = [new_data]  # Convert to list of one array
-
-                    # Update buffers
-                    for i, ch in enumerate(self.active_channels):
-                        self.data_buffers[ch] = np.roll(self.data_buffers[ch], -len(new_data[i]))
-                        self.data_buffers[ch][-len(new_data[i]):] = new_data[i]
-
-                    # Log to HDF5 (optimized)
-                    if self.is_logging and self.h5_file:
-                        timestamp = datetime.now().isoformat()
-                        for i, ch in enumerate(self.active_channels):
-                            # Get dataset references once
-                            data_dset = self.h5_file[f"data/{self.all_channels[ch]}"]
-                            time_dset = self.h5_file[f"timestamps/{self.all_channels[ch]}"]
-
-                            # Calculate new size
-                            new_length = data_dset.shape[0] + len(new_data[i])
-
-                            # Resize datasets
-                            data_dset.resize(new_length, axis=0)
-                            time_dset.resize(new_length, axis=0)
-
-                            # Store data
-                            data_dset[-len(new_data[i]):] = new_data[i]
-                            time_dset[-len(new_data[i]):] = timestamp
-
-                except nidaqmx.DaqError as e:
-                    if e.error_code == -200284:
-                        print("Buffer overflow - consider increasing read frequency or buffer size")
-                        continue
-                    elif e.error_code == -200279:
-                        print("Read position error - retrying...")
-                        continue
-                    print(f"Error occurred while processing index {i}, data: {new_data[i]}")
-                    raise
+        # One timestamp row per contiguous run in the block
+        segs = self.flush_segs[ch]
+        time_dset.resize(time_dset.shape[0] + len(segs), axis=0)
+        time_dset[-len(segs):] = np.array([tuple(s) for s in segs], dtype=TIMESTAMP_DTYPE)
 
-                time.sleep(self.update_interval / 1000)
-        finally:
-            task.stop()
-            task.close()
+        segs.clear()
+        self.flush_fill[ch] = 0
 
     def toggle_logging(self):
         """Start/Stop HDF5 logging."""
@@ -396,58 +432,110 @@ class MultiChannelDAQ_GUI(QMainWindow):
             if self.server.read_data('storePath') is not None:
                 filename = self.server.read_data('storePath') + filename
 
-            self.h5_file = h5py.File(filename, 'w')
-
-            # Create resizable datasets for all active channels
-            for ch in self.active_channels:
-                self.h5_file.create_dataset(
+            # Larger chunk cache so the open block of every channel stays resident;
+            # latest file format so the file can be read live in SWMR mode
+            self.h5_file = h5py.File(filename, 'w', libver='latest', track_order=False, locking=False,
+                                     rdcc_nbytes=64 * 1024 * 1024, rdcc_nslots=10007, rdcc_w0=0.75)
+            self.h5_file.attrs['sample_rate'] = self.sample_rate
+            self.h5_file.attrs['start_monotonic_ns'] = time.monotonic_ns()
+            self.h5_file.attrs['start_time_ns'] = time.time_ns()
+
+            # Create resizable datasets for every channel, so channels enabled during the
+            # recording are logged too (SWMR mode allows no new datasets later)
+            self.flush_bufs = {}
+            self.flush_fill = {}
+            self.flush_segs = {}
+            self.write_ptr = {}
+            self.log_dsets = {}
+            for ch in self.all_channels:
+                data_dset = self.h5_file.create_dataset(
                     f"data/{self.all_channels[ch]}",
                     shape=(0,),
                     maxshape=(None,),
-                    dtype=np.float64,
-                    compression="gzip"
+                    dtype=np.int16,
+                    chunks=(self.flush_size,)  # Uncompressed: ~20 KB/s per channel is no disk load
                 )
-                self.h5_file.create_dataset(
+                # Channels that have never been acquired get the default +/-10 V coefficients
+                data_dset.attrs['scaling_coeff'] = self.scaling_coeff.get(ch, DEFAULT_SCALING_COEFF)
+                time_dset = self.h5_file.create_dataset(
                     f"timestamps/{self.all_channels[ch]}",
                     shape=(0,),
                     maxshape=(None,),
-                    dtype=h5py.string_dtype(encoding='utf-8'),
-                    compression="gzip"
+                    dtype=TIMESTAMP_DTYPE,
+                    chunks=(1024,)
                 )
+                self.log_dsets[ch] = (data_dset, time_dset)
+                self.flush_bufs[ch] = np.empty(self.flush_size, dtype=np.int16)
+                self.flush_fill[ch] = 0
+                self.flush_segs[ch] = []
+                self.write_ptr[ch] = 0
+
+            # No new datasets or attributes after this; readers may now open the file with swmr=True
+            self.h5_file.swmr_mode = True
+
+            self._hdf5_chunks = deque()
+            self._hdf5_ready = Event()
+            self._hdf5_writer_thread = Thread(target=self._hdf5_consumer, daemon=True)
+            self._hdf5_writer_thread.start()
+            self._flush_stop = Event()
+            self._flush_thread = Thread(target=self._flush_loop, daemon=True)
+            self._flush_thread.start()
 
             self.btn_log.setText("Stop Logging")
             self.is_logging = True
-            self.server.write_data('recording', 1)  # Update shared value
+            self.server.write_flag('recording', 1)  # Update shared value
         else:
-            # Close HDF5 file
+            # Let the writer drain the queue, write out partial blocks, then close HDF5 file
+            self.is_logging = False
+            if self._flush_thread:
+                self._flush_stop.set()
+                self._flush_thread.join()
+                self._flush_thread = None
+            if self._hdf5_writer_thread:
+                self._hdf5_chunks.append(None)
+                self._hdf5_ready.set()
+                self._hdf5_writer_thread.join()
+                self._hdf5_writer_thread = None
             if self.h5_file:
+                for ch in self.flush_bufs:
+                    try:
+                        self.flush_channel(ch)
+                    except Exception as e:
+                        print(f"Error flushing channel {ch}: {str(e)}")
                 self.h5_file.close()
                 self.h5_file = None
             self.btn_log.setText("Start Logging")
-            self.is_logging = False
-            self.server.write_data('recording', 0)  # Update shared value
+            self.server.write_flag('recording', 0)  # Update shared value
 
     def update_plots(self):
         """Update all active plots."""
-        if not hasattr(self, 'plot_curves'):
+        if not hasattr(self, 'plot_curves') or not self.dirty.is_set():
             return
+        self.dirty.clear()
 
-        time_axis = np.linspace(0, self.plot_window, self.buffer_size)
+        # Draw one (min, max) pair per horizontal pixel instead of every sample
         for ch in self.active_channels:
-            self.plot_curves[ch].setData(time_axis, self.data_buffers[ch])
+            out_len = max(1, min(self.plot_items[ch].width(), self.buffer_size))
+            if self.time_axis is None or len(self.time_axis) != 2 * out_len:
+                self.time_axis = np.linspace(-self.plot_window, 0, 2 * out_len)
+            y = minmax_decimate(self.data_buffers[self.ch_idx[ch]], self.write_idx, out_len)
+            # Convert to volts only after decimation, on the plot-sized array
+            y = np.polynomial.polynomial.polyval(y, self.scaling_coeff.get(ch, DEFAULT_SCALING_COEFF))
+            # Scaled ADC codes are always finite, so skip pyqtgraph's per-frame NaN/inf scan
+            self.plot_curves[ch].setData(self.time_axis, y, skipFiniteCheck=True)
 
     def closeEvent(self, event):
         """Cleanup on exit."""
+        self.stop_logging_monitor()  # Before anything else, so no external command toggles logging meanwhile
         self.stop_event.set()
         if self.daq_thread and self.daq_thread.is_alive():
             self.daq_thread.join()
-        if self.h5_file:
-            self.h5_file.close()
+        if self.is_logging:
+            self.toggle_logging()
         if hasattr(self, 'process') and self.process.is_alive():
             self.process.terminate()
         event.accept()
         self.server.close()
-        self.stop_logging_monitor()
 
 
 if __name__ == "__main__":
@@ -458,6 +546,6 @@ if __name__ == "__main__":
     # Timer for plot updates
     timer = pg.QtCore.QTimer()
     timer.timeout.connect(window.update_plots)
-    timer.start(100)  # 100 ms refresh
+    timer.start(250)  # 250 ms refresh; skipped when no new samples arrived
 
     sys.exit(app.exec())
\ No newline at end of file
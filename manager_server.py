@@ -1,26 +1,33 @@
 from multiprocessing.managers import BaseManager
-from threading import RLock
-import sys
+from multiprocessing import shared_memory
+from threading import Lock, Condition
+import pickle
+
+# Small numeric flags are polled constantly, so they live in shared memory
+# instead of going through the manager. One byte per flag.
+FLAGS_NAME = 'daq_flags'
+FLAGS_SIZE = 64
+FLAG_SLOTS = {'recording': 0, 'recording_command': 1}
+FLAG_UNSET = 255  # Byte value meaning "no value" (None)
 
 
 class SharedData:
     def __init__(self):
         self._data = {}
-        self._lock = RLock()  # Reentrant lock for all operations
+        self._snapshot = {}  # Copy of _data republished after every write; read without locking
+        self._sizes = {}  # Size of each stored value, so the total is kept incrementally
+        self._total_size = 0
+        self._lock = Lock()  # Serializes writers; nothing here re-enters it
+        self._command_changed = Condition(self._lock)  # Signalled when recording_command is written
+        self._command_version = 0
 
     def _get_size(self, obj):
-        """Calculate approximate memory usage of an object in bytes"""
-        size = sys.getsizeof(obj)
-        if isinstance(obj, dict):
-            size += sum(self._get_size(k) + self._get_size(v) for k, v in obj.items())
-        elif isinstance(obj, (list, tuple, set)):
-            size += sum(self._get_size(x) for x in obj)
-        return size
+        """Size in bytes of the object as pickled for the manager connection (counts array buffers)"""
+        return len(pickle.dumps(obj, protocol=5))
 
     def get_data(self):
-        """Read-protected method that returns a copy of the data"""
-        with self._lock:
-            return self._data.copy()
+        """Return the latest published snapshot of the data (treat as read-only)"""
+        return self._snapshot
 
     def update_data(self, key, value):
         # Calculate size of new value without lock
@@ -31,21 +38,69 @@ class SharedData:
 
         with self._lock:
             # Check total size under lock to prevent race condition
-            current_size = self._get_size(self._data)
-            if current_size >= 50 * 1024 * 1024:
-                print(
-                    f"Error: Total data size changed to {current_size / 1024 / 1024:.2f} MB while checking, exceeds 50 MB limit")
+            new_total = self._total_size - self._sizes.get(key, 0) + value_size
+            if new_total >= 50 * 1024 * 1024:
+                print(f"Error: Total data size would be {new_total / 1024 / 1024:.2f} MB, exceeds 50 MB limit")
                 return False
 
             # If we get here, both conditions are satisfied
             self._data[key] = value
+            self._snapshot = self._data.copy()
+            self._sizes[key] = value_size
+            self._total_size = new_total
             return True
 
+    def batch_update(self, mapping, notify=False):
+        """Update several keys atomically under one lock; optionally signal a new command"""
+        sizes = {key: self._get_size(value) for key, value in mapping.items()}
+        for key, value_size in sizes.items():
+            if value_size >= 25 * 1024 * 1024:  # 25 MB
+                print(f"Error: Value size of {key} {value_size / 1024 / 1024:.2f} MB exceeds 25 MB limit")
+                return False
+
+        with self._lock:
+            new_total = self._total_size + sum(
+                value_size - self._sizes.get(key, 0) for key, value_size in sizes.items())
+            if new_total >= 50 * 1024 * 1024:
+                print(f"Error: Total data size would be {new_total / 1024 / 1024:.2f} MB, exceeds 50 MB limit")
+                return False
+
+            self._data.update(mapping)
+            self._snapshot = self._data.copy()
+            self._sizes.update(sizes)
+            self._total_size = new_total
+            if notify:
+                self._bump_command_version()
+            return True
+
+    def batch_read(self, keys):
+        """Read several keys from one snapshot; missing keys map to None"""
+        snapshot = self._snapshot
+        return {key: snapshot.get(key) for key in keys}
+
+    def notify_command(self):
+        """Bump the command version and wake clients blocked in wait_for_change"""
+        with self._lock:
+            self._bump_command_version()
+
+    def _bump_command_version(self):
+        # Caller must hold self._lock
+        self._command_version += 1
+        self._command_changed.notify_all()
+
+    def wait_for_change(self, last_version, timeout=30):
+        """Block until the command version differs from last_version or timeout; return the current version"""
+        with self._command_changed:
+            self._command_changed.wait_for(lambda: self._command_version != last_version, timeout)
+            return self._command_version
+
     def delete_data(self, key):
         """Write-protected method to delete data"""
         with self._lock:
             if key in self._data:
                 del self._data[key]
+                self._snapshot = self._data.copy()
+                self._total_size -= self._sizes.pop(key)
                 return True
             return False
 
@@ -58,6 +113,17 @@ if __name__ == '__main__':
     # Only expose the data-related methods
     SharedDataManager.register('get_shared_data', callable=lambda: shared_data)
 
+    # Preallocate the flag block; reuse it if a previous server left it behind
+    try:
+        flags = shared_memory.SharedMemory(name=FLAGS_NAME, create=True, size=FLAGS_SIZE)
+    except FileExistsError:
+        flags = shared_memory.SharedMemory(name=FLAGS_NAME)
+    flags.buf[:FLAGS_SIZE] = bytes([FLAG_UNSET]) * FLAGS_SIZE
+
     manager = SharedDataManager(address=('localhost', 50000), authkey=b'AEPsecret')
     print("Manager server running (data only)...")
-    manager.get_server().serve_forever()
\ No newline at end of file
+    try:
+        manager.get_server().serve_forever()
+    finally:
+        flags.close()
+        flags.unlink()
\ No newline at end of file
@@ -7,11 +7,29 @@ from PyQt6.QtCore import Qt, pyqtSignal, QObject
 from PyQt6.QtNetwork import QLocalServer, QLocalSocket
 import pyqtgraph as pg
 import nidaqmx
-from threading import Thread, Event
+from nidaqmx.stream_readers import AnalogMultiChannelReader
+from threading import Thread, Event, Lock
 import h5py
 from datetime import datetime
 import time
 import json
+import re
+
+
+def next_prime(n):
+    """Return the smallest prime >= n (HDF5 wants a prime number of chunk cache slots)."""
+    n = max(n, 2)
+    while any(n % d == 0 for d in range(2, int(n ** 0.5) + 1)):
+        n += 1
+    return n
+
+
+def json_incomplete(text, err):
+    """Return True if a JSONDecodeError only means text stops before the document ends."""
+    tail = text[err.pos:]
+    return (err.msg.startswith('Unterminated string')
+            or any(lit.startswith(tail) for lit in ('true', 'false', 'null'))
+            or re.fullmatch(r'-?\d*\.?\d*([eE][-+]?\d*)?', tail) is not None)
 
 
 class DAQController(QObject):
@@ -42,9 +60,11 @@ class MultiChannelDAQ_GUI(QMainWindow):
         # Start with first two channels enabled by default
         self.active_channels = ["Dev1/ai0", "Dev1/ai1"]
         self.data_buffers = {ch: np.zeros(self.buffer_size) for ch in self.active_channels}
+        self.write_idx = {ch: 0 for ch in self.active_channels}  # Circular write cursor (oldest sample)
         self.stop_event = Event()
         self.is_logging = False
         self.h5_file = None
+        self._log_lock = Lock()  # Guards the HDF5 file and staging buffers between DAQ and GUI threads
         self.tab_orange_rgb = (255, 127, 14)  # Matplotlib's tab:orange in 0-255 range
 
         # GUI Setup
@@ -71,14 +91,14 @@ class MultiChannelDAQ_GUI(QMainWindow):
         channel_layout = QHBoxLayout()
 
         # Checkboxes for each channel
-        self.channel_checkboxes = []
+        self._cb_for_ch = {}
         for ch_id, ch_name in self.all_channels.items():
             cb = QCheckBox(ch_name)
             # Set first two channels checked by default
             if ch_id in self.active_channels:
                 cb.setChecked(True)
             cb.stateChanged.connect(self.update_active_channels)
-            self.channel_checkboxes.append(cb)
+            self._cb_for_ch[ch_id] = cb
             channel_layout.addWidget(cb)
 
         channel_select.setLayout(channel_layout)
@@ -130,30 +150,40 @@ class MultiChannelDAQ_GUI(QMainWindow):
         socket.disconnected.connect(socket.deleteLater)
 
     def process_command(self, socket):
-        """Process incoming command from socket with robust error handling"""
-        socket.setReadBufferSize(1024)  # Explicit buffer size
-
-        # Initial data availability check
-        if not socket.bytesAvailable():
-            if not socket.waitForReadyRead(5000):  # Extended timeout
-                print(f"No data after 5s (Buffers: {socket.bytesAvailable()} bytes)")
-                socket.write(json.dumps({"status": "error", "message": "Connection timeout"}).encode())
-                socket.flush()
-                return False
+        """Handle every complete command buffered on the socket; called from readyRead, never blocks"""
+        while socket.canReadLine():
+            self.handle_command(socket, socket.readLine().data().decode().strip())
+
+        # Commands sent without a trailing newline: handle each complete JSON document,
+        # leave an incomplete one buffered and reject anything malformed
+        text = socket.peek(socket.bytesAvailable()).data().decode(errors='replace')
+        decoder = json.JSONDecoder()
+        pos = 0
+        while True:
+            while pos < len(text) and text[pos].isspace():
+                pos += 1
+            if pos == len(text):
+                break
+            try:
+                _, end = decoder.raw_decode(text, pos)
+            except json.JSONDecodeError as e:
+                if not json_incomplete(text, e):
+                    # Drop the unparseable bytes so they cannot block later commands
+                    socket.readAll()
+                    self.handle_command(socket, text[pos:].strip())
+                    return
+                break  # Wait for the next readyRead
+            self.handle_command(socket, text[pos:end])
+            pos = end
+        if pos:
+            socket.read(len(text[:pos].encode()))
+
+    def handle_command(self, socket, raw_data):
+        """Parse one JSON command and write the response"""
+        if not raw_data:
+            return
 
         try:
-            print(f"Processing command from {socket.serverName()} (State: {socket.state()})")
-
-            # Secondary verification of data availability
-            if not socket.waitForReadyRead(1000):
-                error_msg = "No data received within timeout"
-                print(f"Error: {error_msg}")
-                socket.write(json.dumps({"status": "error", "message": error_msg}).encode())
-                socket.flush()
-                return False
-
-            # Read and parse command
-            raw_data = socket.readLine().data().decode().strip()
             print(f"Received raw command: {raw_data}")
 
             try:
@@ -171,21 +201,15 @@ class MultiChannelDAQ_GUI(QMainWindow):
             except json.JSONDecodeError as e:
                 response = {"status": "error", "message": f"Invalid JSON: {str(e)}"}
 
-            # Send response
+            # Send response; Qt writes it out from the event loop
             response_str = json.dumps(response)
             print(f"Sending response: {response_str}")
             socket.write(response_str.encode())
-            if not socket.waitForBytesWritten(1000):
-                print(f"Warning: Failed to confirm response sent: {socket.errorString()}")
-                return False
-
-            return True
 
         except Exception as e:
             error_msg = f"Server error: {str(e)}"
             print(f"Critical error: {error_msg}")
             socket.write(json.dumps({"status": "error", "message": error_msg}).encode())
-            return False
         finally:
             socket.flush()
             print("Command processing completed")
@@ -199,25 +223,31 @@ class MultiChannelDAQ_GUI(QMainWindow):
 
     def update_active_channels(self):
         """Update which channels are active based on checkboxes."""
-        self.active_channels = [
-            ch_id for ch_id, ch_name in self.all_channels.items()
-            if any(cb.isChecked() and cb.text() == ch_name
-                   for cb in self.channel_checkboxes)
-        ]
+        active_channels = [ch for ch, cb in self._cb_for_ch.items() if cb.isChecked()]
+
+        # Stop the running acquisition before touching its channel list and buffers
+        if self.daq_thread and self.daq_thread.is_alive():
+            self.stop_event.set()
+            self.daq_thread.join()
+
+        old_set = set(self.active_channels)
+        self.active_channels = active_channels
+        new_set = set(self.active_channels)
 
-        # Reset data buffers
-        self.data_buffers = {ch: np.zeros(self.buffer_size)
-                             for ch in self.active_channels}
+        # Only reset buffers of channels that were toggled
+        for ch in old_set - new_set:
+            self.data_buffers.pop(ch, None)
+            self.write_idx.pop(ch, None)
+        for ch in new_set - old_set:
+            self.data_buffers[ch] = np.zeros(self.buffer_size)
+            self.write_idx[ch] = 0
 
         # Rebuild plots
         self.rebuild_plots()
 
-        # Start/restart DAQ thread if needed
+        # Restart DAQ thread if needed
         if self.active_channels:
             self.btn_log.setEnabled(True)
-            if self.daq_thread and self.daq_thread.is_alive():
-                self.stop_event.set()
-                self.daq_thread.join()
             self.stop_event = Event()
             self.daq_thread = Thread(target=self.daq_worker, daemon=True)
             self.daq_thread.start()
@@ -258,42 +288,59 @@ class MultiChannelDAQ_GUI(QMainWindow):
         )
         task.start()
 
+        # Read straight into a preallocated (channels, samples) array
+        reader = AnalogMultiChannelReader(task.in_stream)
+        self._read_buf = np.empty((len(self.active_channels), self.read_chunk_size), dtype=np.float64)
+
         try:
             while not self.stop_event.is_set():
                 try:
                     # Read smaller chunks more frequently
-                    new_data = task.read(
+                    reader.read_many_sample(
+                        self._read_buf,
                         number_of_samples_per_channel=self.read_chunk_size,
                         timeout=2.0  # Timeout in seconds
                     )
+                    new_data = self._read_buf
 
-                    # Handle single channel case (returns 1D array) vs multi-channel (returns list of arrays)
-                    if len(self.active_channels) == 1:
-                        new_data = [new_data]  # Convert to list of one array
-
-                    # Update buffers
+                    # Update circular buffers in place
                     for i, ch in enumerate(self.active_channels):
-                        self.data_buffers[ch] = np.roll(self.data_buffers[ch], -len(new_data[i]))
-                        self.data_buffers[ch][-len(new_data[i]):] = new_data[i]
+                        buf = self.data_buffers[ch]
+                        n = len(new_data[i])
+                        idx = self.write_idx[ch]
+                        end = idx + n
+                        if end <= self.buffer_size:
+                            buf[idx:end] = new_data[i]
+                        else:
+                            k = self.buffer_size - idx
+                            buf[idx:] = new_data[i][:k]
+                            buf[:end - self.buffer_size] = new_data[i][k:]
+                        self.write_idx[ch] = end % self.buffer_size
 
                     # Log to HDF5 (optimized)
-                    if self.is_logging and self.h5_file:
-                        timestamp = datetime.now().isoformat()
-                        for i, ch in enumerate(self.active_channels):
-                            # Get dataset references once
-                            data_dset = self.h5_file[f"data/{self.all_channels[ch]}"]
-                            time_dset = self.h5_file[f"timestamps/{self.all_channels[ch]}"]
-
-                            # Calculate new size
-                            new_length = data_dset.shape[0] + len(new_data[i])
-
-                            # Resize datasets
-                            data_dset.resize(new_length, axis=0)
-                            time_dset.resize(new_length, axis=0)
-
-                            # Store data
-                            data_dset[-len(new_data[i]):] = new_data[i]
-                            time_dset[-len(new_data[i]):] = timestamp
+                    with self._log_lock:
+                        if self.is_logging and self.h5_file:
+                            timestamp_ns = time.time_ns()
+                            for i, ch in enumerate(self.active_channels):
+                                if ch not in self._log_dsets:
+                                    continue  # Channel was enabled after logging started
+                                data_dset, time_dset = self._log_dsets[ch]
+                                stage = self._stage[ch]
+
+                                # One (sample_index, unix_ns) row per read, written with the block
+                                self._stage_times[ch].append(
+                                    (data_dset.shape[0] + self._stage_idx[ch], timestamp_ns))
+
+                                # Stage samples and write whole 1 s chunks only
+                                samples = new_data[i]
+                                while len(samples):
+                                    idx = self._stage_idx[ch]
+                                    k = min(len(samples), len(stage) - idx)
+                                    stage[idx:idx + k] = samples[:k]
+                                    self._stage_idx[ch] = idx + k
+                                    samples = samples[k:]
+                                    if self._stage_idx[ch] == len(stage):
+                                        self.flush_stage(ch)
 
                 except nidaqmx.DaqError as e:
                     if e.error_code == -200284:
@@ -314,34 +361,68 @@ class MultiChannelDAQ_GUI(QMainWindow):
         if not self.is_logging:
             # Initialize HDF5 file
             filename = f"daq_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.h5"
-            self.h5_file = h5py.File(filename, 'w')
-
-            # Create resizable datasets for all active channels
+            # Chunk cache large enough to keep the open 1 s chunk of every channel in memory,
+            # never below HDF5's 1 MiB default, with ~100 hash slots per cached chunk
+            chunk_bytes = self.sample_rate * 8
+            rdcc_nbytes = max(1 << 20, len(self.active_channels) * chunk_bytes * 4)
+            self.h5_file = h5py.File(filename, 'w',
+                                     rdcc_nbytes=rdcc_nbytes,
+                                     rdcc_nslots=next_prime(100 * (rdcc_nbytes // chunk_bytes)))
+            self.h5_file.attrs['start_time_ns'] = time.time_ns()
+            self.h5_file.attrs['sample_rate'] = self.sample_rate
+
+            # Create resizable datasets for all active channels, keeping handles for the DAQ loop
+            self._log_dsets = {}
+            self._stage = {}
+            self._stage_idx = {}
+            self._stage_times = {}
             for ch in self.active_channels:
-                self.h5_file.create_dataset(
+                data_dset = self.h5_file.create_dataset(
                     f"data/{self.all_channels[ch]}",
                     shape=(0,),
                     maxshape=(None,),
                     dtype=np.float64,
-                    compression="gzip"
+                    chunks=(self.sample_rate,),
+                    compression="lzf"  # Several times faster than gzip inside the DAQ thread
                 )
-                self.h5_file.create_dataset(
+                time_dset = self.h5_file.create_dataset(
                     f"timestamps/{self.all_channels[ch]}",
-                    shape=(0,),
-                    maxshape=(None,),
-                    dtype=h5py.string_dtype(encoding='utf-8'),
-                    compression="gzip"
+                    shape=(0, 2),
+                    maxshape=(None, 2),
+                    dtype=np.int64,
+                    chunks=(1024, 2)
                 )
+                self._log_dsets[ch] = (data_dset, time_dset)
+                self._stage[ch] = np.empty(self.sample_rate, dtype=np.float64)
+                self._stage_idx[ch] = 0
+                self._stage_times[ch] = []
 
             self.btn_log.setText("Stop Logging")
             self.is_logging = True
         else:
-            # Close HDF5 file
-            if self.h5_file:
-                self.h5_file.close()
-                self.h5_file = None
+            # Wait for any in-progress DAQ write, then write out partially filled stages and close
+            with self._log_lock:
+                self.is_logging = False
+                if self.h5_file:
+                    for ch in self._log_dsets:
+                        self.flush_stage(ch)
+                    self.h5_file.close()
+                    self.h5_file = None
             self.btn_log.setText("Start Logging")
-            self.is_logging = False
+
+    def flush_stage(self, ch):
+        """Append a channel's staged samples and timestamp rows to its datasets."""
+        n = self._stage_idx[ch]
+        rows = self._stage_times[ch]
+        data_dset, time_dset = self._log_dsets[ch]
+        if n:
+            data_dset.resize(data_dset.shape[0] + n, axis=0)
+            data_dset[-n:] = self._stage[ch][:n]
+            self._stage_idx[ch] = 0
+        if rows:
+            time_dset.resize(time_dset.shape[0] + len(rows), axis=0)
+            time_dset[-len(rows):] = rows
+            rows.clear()
 
     def update_plots(self):
         """Update all active plots."""
@@ -350,15 +431,17 @@ class MultiChannelDAQ_GUI(QMainWindow):
 
         time_axis = np.linspace(0, self.plot_window, self.buffer_size)
         for ch in self.active_channels:
-            self.plot_curves[ch].setData(time_axis, self.data_buffers[ch])
+            buf = self.data_buffers[ch]
+            idx = self.write_idx[ch]
+            self.plot_curves[ch].setData(time_axis, np.concatenate((buf[idx:], buf[:idx])))
 
     def closeEvent(self, event):
         """Cleanup on exit."""
         self.stop_event.set()
         if self.daq_thread and self.daq_thread.is_alive():
             self.daq_thread.join()
-        if self.h5_file:
-            self.h5_file.close()
+        if self.is_logging:
+            self.toggle_logging()  # Writes out staged samples before closing the file
         if hasattr(self, 'server') and self.server.isListening():
             self.server.close()
         event.accept()
@@ -1,8 +1,9 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
+import pyqtgraph as pg
+from pyqtgraph.Qt import QtCore
 from nidaqmx import Task
 from nidaqmx.constants import AcquisitionType
+from nidaqmx.stream_readers import AnalogMultiChannelReader
 import time
 
 # Configuration
@@ -14,27 +15,37 @@ buffer_size = sample_rate * window_seconds  # total samples to keep in memory
 
 # Initialize data buffer
 data_buffer = np.zeros((buffer_size, len(channels)))
+data_buffer_flat = data_buffer.reshape(-1)  # View for shifting the whole buffer at once
 
-# Create figure and axes
-fig, ax = plt.subplots(len(channels), 1, figsize=(10, 8), sharex=True)
-if len(channels) == 1:
-    ax = [ax]  # Ensure ax is always a list for consistency
+# Render line strips with OpenGL
+pg.setConfigOptions(useOpenGL=True, enableExperimental=True, antialias=False)
+app = pg.mkQApp("Real-time DAQ")
 
-# Set up plots
-lines = []
-for i, ch in enumerate(channels):
-    lines.append(ax[i].plot([], [], label=ch)[0])
-    ax[i].set_ylabel(f'Channel {ch}\nVoltage (V)')
-    ax[i].legend(loc='upper right')
-    ax[i].grid(True)
-
-ax[-1].set_xlabel('Time (s)')
-fig.suptitle(f'Real-time DAQ Data from {device_name}')
-plt.tight_layout()
+# Create window with one plot per channel
+win = pg.GraphicsLayoutWidget(title=f'Real-time DAQ Data from {device_name}', size=(1000, 800))
 
 # Time axis
 time_axis = np.linspace(-window_seconds, 0, buffer_size)
 
+# Set up plots; axis limits are fixed, so frames only replace curve data
+curves = []
+for i, ch in enumerate(channels):
+    plot = win.addPlot(row=i, col=0)
+    plot.setLabel('left', f'Channel {ch}\nVoltage (V)')
+    plot.setXRange(-window_seconds, 0)
+    plot.setYRange(-10, 10)
+    plot.showGrid(x=True, y=True)
+    plot.addLegend(offset=(-10, 10))
+    if i > 0:
+        plot.setXLink(curves[0].getViewBox())
+    curve = plot.plot(time_axis, data_buffer[:, i], name=ch)
+    curve.setDownsampling(auto=True, method='peak')
+    curve.setClipToView(True)
+    curves.append(curve)
+
+plot.setLabel('bottom', 'Time (s)')
+win.show()
+
 # Initialize DAQ task
 task = Task()
 for ch in channels:
@@ -49,35 +60,36 @@ task.timing.cfg_samp_clk_timing(
 # Start the task
 task.start()
 
-def update(frame):
+# Read straight into a preallocated (channels, samples) array
+reader = AnalogMultiChannelReader(task.in_stream)
+read_buf = np.empty((len(channels), sample_rate // 10))  # 100ms of data
+
+def update():
     # Read new data
-    new_data = task.read(number_of_samples_per_channel=sample_rate//10)  # read 100ms of data
+    reader.read_many_sample(read_buf, number_of_samples_per_channel=read_buf.shape[1])
+    n = read_buf.shape[1]
     
-    # Convert to numpy array if it isn't already
-    new_data = np.array(new_data).T  # shape: (n_samples, n_channels)
-    
-    # Update data buffer (roll and replace)
-    global data_buffer
-    data_buffer = np.roll(data_buffer, -len(new_data), axis=0)
-    data_buffer[-len(new_data):, :] = new_data
+    # Shift the data buffer left in place (through the flat view, so NumPy needs no temporary)
+    # and append the new samples
+    k = n * len(channels)
+    data_buffer_flat[:-k] = data_buffer_flat[k:]
+    data_buffer[-n:] = read_buf.T  # (n_samples, n_channels) view
     
     # Update plots
     for i in range(len(channels)):
-        lines[i].set_data(time_axis, data_buffer[:, i])
-        ax[i].relim()
-        ax[i].autoscale_view()
-    
-    return lines
+        curves[i].setData(time_axis, data_buffer[:, i], skipFiniteCheck=True)
 
-# Create animation
-ani = FuncAnimation(fig, update, interval=100, blit=True)  # update every 100ms
+# Drive updates from the Qt event loop
+timer = QtCore.QTimer()
+timer.timeout.connect(update)
+timer.start(100)  # update every 100ms
 
 try:
-    plt.show()
+    app.exec()
 except KeyboardInterrupt:
     print("Stopping acquisition...")
 
 # Clean up
+timer.stop()
 task.stop()
 task.close()
-plt.close()